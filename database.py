@@ -1,29 +1,246 @@
 # database.py - Database operations
 import sqlite3
 import threading
+import os
 import json
 import random
-import math
+import time
+import configparser
+from bisect import bisect_right
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
-# Thread-safe database connection
+# Load configuration
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+LEVEL_COIN_REWARD = config.getint('GAME', 'level_coin_reward', fallback=50)
+MAX_LEVEL = config.getint('GAME', 'max_level', fallback=100)
+LEDGER_RETRY_INTERVAL = config.getfloat('GAME', 'ledger_retry_interval', fallback=1.0)
+LEDGER_BATCH_SIZE = config.getint('GAME', 'ledger_batch_size', fallback=100)
+# Set by the supervisor when this process is one of several sharded workers
+SHARDED = bool(os.getenv('WORKER_ID'))
+# Seconds to wait for another worker process to release the database
+DB_BUSY_TIMEOUT = config.getfloat('GAME', 'db_busy_timeout', fallback=30.0)
+PLAYER_CACHE_SIZE = config.getint('GAME', 'player_cache_size', fallback=1000)
+INVENTORY_PAGE_SIZE = config.getint('GAME', 'inventory_page_size', fallback=10)
+
+# Level tiers: a player reaches a tier once their level is >= its starting level
+TIER_LEVELS = [5, 10, 20, 30, 40, 50]
+TIER_NAMES = ["beginner", "apprentice", "journeyman", "adept", "expert", "master", "grandmaster"]
+
+# Thread-safe database connection. db_lock only serializes threads within one
+# process; sharded workers share rpg.db through SQLite's WAL and file locks.
 db_lock = threading.Lock()
 
 class Database:
+    def __init__(self, immediate=False, snapshot=False):
+        # immediate takes the write lock up front, for read-then-write
+        # operations that must not interleave with other worker processes;
+        # snapshot runs several SELECTs against one consistent WAL snapshot
+        self.immediate = immediate
+        self.snapshot = snapshot
+
     def __enter__(self):
         db_lock.acquire()
-        self.conn = sqlite3.connect('rpg.db', check_same_thread=False)
+        try:
+            self.conn = sqlite3.connect('rpg.db', timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+            if self.immediate:
+                self.conn.execute("BEGIN IMMEDIATE")
+            elif self.snapshot:
+                self.conn.execute("BEGIN")
+        except Exception:
+            db_lock.release()
+            raise
+        Database.owner = threading.get_ident()
         return self.conn.cursor()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         try:
-            self.conn.commit()
+            # Ledger events share the caller's transaction, so a failure must
+            # not commit half of the state they belong to
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
         finally:
             self.conn.close()
+            Database.owner = None
             db_lock.release()
 
+# Thread currently inside a Database() block
+Database.owner = None
+
+class LedgerWriter:
+    """Group-commits economy events to the ledger.
+
+    Callers already inside a transaction pass its cursor, and the event
+    commits together with the state it belongs to. Other callers block in
+    record() until the writer thread has committed the batch holding their
+    event; events that arrive while a commit is in progress share the next
+    one. A failed batch is retried every LEDGER_RETRY_INTERVAL seconds."""
+
+    def __init__(self, retry_interval=LEDGER_RETRY_INTERVAL, batch_size=LEDGER_BATCH_SIZE):
+        self.retry_interval = retry_interval
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.committed = threading.Condition(self.lock)
+        self.pending = []
+        self.queued_seq = 0
+        self.committed_seq = 0
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def record(self, user_id, kind, amount, item_id=None, reason=None, c=None):
+        # Coerce here so a malformed event fails its caller, not a whole batch
+        event = (int(user_id), str(kind), None if item_id is None else int(item_id),
+                 int(amount), None if reason is None else str(reason), datetime.now())
+        if c is not None:
+            c.execute('''INSERT INTO ledger (user_id, kind, item_id, amount, reason, created_at)
+                      VALUES (?, ?, ?, ?, ?, ?)''', event)
+            return
+        if Database.owner == threading.get_ident():
+            raise RuntimeError("ledger.record() inside a Database() block must pass its cursor")
+
+        self.start()
+        with self.lock:
+            self.queued_seq += 1
+            seq = self.queued_seq
+            self.pending.append((seq, event))
+        self.wakeup.set()
+        with self.committed:
+            while self.committed_seq < seq:
+                self.committed.wait()
+
+    def flush(self):
+        """Commit up to batch_size pending events in one transaction"""
+        with Database() as c:
+            with self.lock:
+                batch = self.pending[:self.batch_size]
+                del self.pending[:len(batch)]
+            if not batch:
+                return 0
+            try:
+                c.executemany('''INSERT INTO ledger (user_id, kind, item_id, amount, reason, created_at)
+                              VALUES (?, ?, ?, ?, ?, ?)''', [event for _, event in batch])
+                c.connection.commit()
+            except Exception:
+                # The writer owns this transaction, so the batch can be retried
+                with self.lock:
+                    self.pending[:0] = batch
+                raise
+        with self.committed:
+            self.committed_seq = batch[-1][0]
+            self.committed.notify_all()
+        return len(batch)
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            while self.pending:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Ledger flush error: {e}")
+                    time.sleep(self.retry_interval)
+
+ledger = LedgerWriter()
+
+class PlayerCache:
+    """Bounded LRU cache of player profile and inventory snapshots.
+
+    Mutating database functions invalidate the entries they touch. A snapshot
+    is only stored if its key was not invalidated while it was being loaded,
+    so a racing write can never leave a stale entry behind. Entries may carry
+    a version stamp, and get() only serves them while the stamp matches."""
+
+    def __init__(self, max_size=PLAYER_CACHE_SIZE):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # key -> [loads in flight, generation]; only kept while a load runs
+        self.loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def start_load(self, key):
+        """Register a load; pass the token to put() and always call finish_load()"""
+        with self.lock:
+            load = self.loading.setdefault(key, [0, 0])
+            load[0] += 1
+            return load[1]
+
+    def finish_load(self, key):
+        with self.lock:
+            load = self.loading[key]
+            load[0] -= 1
+            if not load[0]:
+                del self.loading[key]
+
+    def get(self, key, stamp=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and (stamp is None or entry[1] == stamp):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, token, stamp=None):
+        with self.lock:
+            load = self.loading.get(key)
+            if not load or load[1] != token:
+                return
+            self.entries[key] = (value, stamp)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id, profile=True, inventory=True):
+        keys = [key for key, wanted in ((("profile", user_id), profile), (("inventory", user_id), inventory)) if wanted]
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+                if key in self.loading:
+                    self.loading[key][1] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            for load in self.loading.values():
+                load[1] += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+player_cache = PlayerCache()
+
 def initialize_database():
     with Database() as c:
+        # WAL lets worker processes read while another one writes
+        c.execute("PRAGMA journal_mode = WAL")
+        
         # Players table
         c.execute('''CREATE TABLE IF NOT EXISTS players (
             user_id INTEGER PRIMARY KEY,
@@ -39,9 +256,22 @@ def initialize_database():
             tier TEXT DEFAULT 'beginner',
             current_dungeon_end DATETIME,
             current_dungeon_stamina INTEGER,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            version INTEGER DEFAULT 0
         )''')
         
+        # Profile version, used by sharded workers to validate cached profiles.
+        # xp and coins are left out: they only move when ledger events are folded.
+        c.execute("PRAGMA table_info(players)")
+        if "version" not in [column[1] for column in c.fetchall()]:
+            c.execute("ALTER TABLE players ADD COLUMN version INTEGER DEFAULT 0")
+        c.execute('''CREATE TRIGGER IF NOT EXISTS players_version
+                  AFTER UPDATE OF username, level, stamina, max_stamina, last_stamina_time, wins, losses,
+                  tier, current_dungeon_end, current_dungeon_stamina ON players
+                  BEGIN
+                      UPDATE players SET version = version + 1 WHERE user_id = NEW.user_id;
+                  END''')
+        
         # Items table
         c.execute('''CREATE TABLE IF NOT EXISTS items (
             item_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -75,6 +305,54 @@ def initialize_database():
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP
         )''')
         
+        # Economy ledger (append-only)
+        c.execute('''CREATE TABLE IF NOT EXISTS ledger (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            item_id INTEGER,
+            amount INTEGER NOT NULL,
+            reason TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_ledger_user ON ledger (user_id, event_id)")
+        
+        # Last ledger event folded into players/inventory totals
+        c.execute('''CREATE TABLE IF NOT EXISTS ledger_checkpoint (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_event_id INTEGER NOT NULL
+        )''')
+        
+        # Leases used to elect one worker for background jobs
+        c.execute('''CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )''')
+        
+        # Shared XP curve, versioned so every worker picks up a reload
+        c.execute('''CREATE TABLE IF NOT EXISTS level_curve (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            base_xp REAL NOT NULL,
+            xp_multiplier REAL NOT NULL,
+            max_level INTEGER NOT NULL
+        )''')
+        _publish_level_curve(c, _config_level_curve())
+        
+        c.execute("SELECT last_event_id FROM ledger_checkpoint WHERE id = 1")
+        if c.fetchone() is None:
+            # Seed the ledger with existing balances so it replays from scratch
+            c.execute('''INSERT INTO ledger (user_id, kind, amount, reason)
+                      SELECT user_id, 'xp', xp, 'opening_balance' FROM players WHERE xp != 0''')
+            c.execute('''INSERT INTO ledger (user_id, kind, amount, reason)
+                      SELECT user_id, 'coins', coins, 'opening_balance' FROM players WHERE coins != 0''')
+            c.execute('''INSERT INTO ledger (user_id, kind, item_id, amount, reason)
+                      SELECT user_id, 'item_grant', item_id, quantity, 'opening_balance'
+                      FROM inventory WHERE quantity != 0''')
+            c.execute('''INSERT INTO ledger_checkpoint (id, last_event_id)
+                      SELECT 1, COALESCE(MAX(event_id), 0) FROM ledger''')
+        
         # Insert default items
         default_items = [
             ("Wooden Sword", "Basic training weapon", 10, "https://i.imgur.com/3sT7VQj.png", "common", 0.3, 1),
@@ -98,40 +376,106 @@ def initialize_database():
 def create_player(user_id, username):
     with Database() as c:
         c.execute("INSERT OR IGNORE INTO players (user_id, username) VALUES (?, ?)", (user_id, username))
+    player_cache.invalidate(user_id, inventory=False)
 
-def get_player(user_id):
-    with Database() as c:
-        c.execute("SELECT * FROM players WHERE user_id = ?", (user_id,))
-        return c.fetchone()
+def get_player(user_id, bypass_cache=False):
+    """Get a player's profile as a dict, with xp and coins including events not yet checkpointed.
 
-def add_xp(user_id, amount):
-    with Database() as c:
-        player = get_player(user_id)
-        if not player:
-            return
-            
-        current_xp = player[2] + amount
-        current_level = player[3]
-        new_level = calculate_level(current_xp)
-        levels_gained = new_level - current_level
-        
-        # Update player
-        new_tier = get_level_tier(new_level)
-        c.execute(
-            "UPDATE players SET xp = ?, level = ?, tier = ? WHERE user_id = ?",
-            (current_xp, new_level, new_tier, user_id)
-        )
-        
-        # Add level up rewards
-        if levels_gained > 0:
-            coin_reward = levels_gained * LEVEL_COIN_REWARD
-            c.execute(
-                "UPDATE players SET coins = coins + ? WHERE user_id = ?",
-                (coin_reward, user_id)
-            )
-            return new_level, coin_reward
+    Pass bypass_cache=True for checks that gate a write."""
+    player = _cached_snapshot(("profile", user_id), user_id, _load_profile, bypass_cache)
+    return dict(player) if player else None
+
+def _load_profile(c, user_id):
+    c.execute("SELECT * FROM players WHERE user_id = ?", (user_id,))
+    row = c.fetchone()
+    if not row:
+        return None
+    player = dict(zip([column[0] for column in c.description], row))
+    player["xp"], player["coins"], _ = _player_totals(c, user_id)
+    return player
+
+def _cached_snapshot(key, user_id, load, bypass_cache=False):
+    """Serve key from player_cache, calling load(c, user_id) on a miss.
+
+    Other sharded workers write without invalidating this process's cache, so
+    in sharded mode a hit is only served while the player's stamp matches."""
+    stamp = None
+    if SHARDED:
+        with Database() as c:
+            stamp = _player_stamp(c, user_id)
+    if not bypass_cache:
+        value = player_cache.get(key, stamp)
+        if value is not None:
+            return value
+    
+    token = player_cache.start_load(key)
+    try:
+        with Database(snapshot=True) as c:
+            value = load(c, user_id)
+            if SHARDED:
+                stamp = _player_stamp(c, user_id)
+        if value is not None:
+            player_cache.put(key, value, token, stamp)
+        return value
+    finally:
+        player_cache.finish_load(key)
+
+def _player_stamp(c, user_id):
+    # players.version is bumped by a trigger on every profile change, and every
+    # balance or item change appends a ledger event
+    c.execute('''SELECT (SELECT version FROM players WHERE user_id = ?),
+              (SELECT COALESCE(MAX(event_id), 0) FROM ledger WHERE user_id = ?)''',
+              (user_id, user_id))
+    return c.fetchone()
+
+def add_xp(user_id, amount, reason=None):
+    with Database(immediate=True) as c:
+        return _apply_xp(c, user_id, amount, reason)
+
+def add_coins(user_id, amount, reason=None, c=None):
+    ledger.record(user_id, "coins", amount, reason=reason, c=c)
+    player_cache.invalidate(user_id, inventory=False)
+
+def _apply_xp(c, user_id, amount, reason=None):
+    _refresh_level_curve(c)
+    totals = _player_totals(c, user_id)
+    if not totals:
+        return
         
-        return new_level, 0
+    current_xp, _, current_level = totals
+    current_xp += amount
+    new_level = calculate_level(current_xp)
+    levels_gained = new_level - current_level
+    
+    # Update player
+    new_tier = get_level_tier(new_level)
+    c.execute(
+        "UPDATE players SET level = ?, tier = ? WHERE user_id = ?",
+        (new_level, new_tier, user_id)
+    )
+    ledger.record(user_id, "xp", amount, reason=reason, c=c)
+    
+    # Add level up rewards
+    coin_reward = 0
+    if levels_gained > 0:
+        coin_reward = levels_gained * LEVEL_COIN_REWARD
+        ledger.record(user_id, "coins", coin_reward, reason="level_up", c=c)
+    
+    player_cache.invalidate(user_id, inventory=False)
+    return new_level, coin_reward
+
+def _player_totals(c, user_id):
+    c.execute("SELECT xp, coins, level FROM players WHERE user_id = ?", (user_id,))
+    player = c.fetchone()
+    if not player:
+        return None
+    
+    xp, coins, level = player
+    c.execute('''SELECT kind, SUM(amount) FROM ledger
+              WHERE user_id = ? AND kind IN ('xp', 'coins') AND event_id > ?
+              GROUP BY kind''', (user_id, _checkpoint_id(c)))
+    unapplied = dict(c.fetchall())
+    return xp + unapplied.get("xp", 0), coins + unapplied.get("coins", 0), level
 
 def regenerate_stamina():
     current_time = datetime.now()
@@ -160,6 +504,7 @@ def regenerate_stamina():
                     "UPDATE players SET stamina = ?, last_stamina_time = ? WHERE user_id = ?",
                     (new_stamina, new_last_time.strftime('%Y-%m-%d %H:%M:%S.%f'), user_id)
                 )
+                player_cache.invalidate(user_id, inventory=False)
 
 # Item operations
 def create_item(name, description, value, image_url, rarity, drop_rate, min_level):
@@ -176,16 +521,77 @@ def get_item(item_id):
 
 def get_random_item():
     with Database() as c:
-        c.execute("SELECT item_id FROM items ORDER BY RANDOM() LIMIT 1")
-        result = c.fetchone()
-        return result[0] if result else None
+        return _random_item_id(c)
 
-def add_item_to_inventory(user_id, item_id, quantity=1):
-    with Database() as c:
-        c.execute('''INSERT OR IGNORE INTO inventory (user_id, item_id, quantity)
-                  VALUES (?, ?, ?)''', (user_id, item_id, quantity))
-        c.execute('''UPDATE inventory SET quantity = quantity + ?
-                  WHERE user_id = ? AND item_id = ?''', (quantity, user_id, item_id))
+def _random_item_id(c):
+    c.execute("SELECT item_id FROM items ORDER BY RANDOM() LIMIT 1")
+    result = c.fetchone()
+    return result[0] if result else None
+
+def add_item_to_inventory(user_id, item_id, quantity=1, reason=None, c=None):
+    ledger.record(user_id, "item_grant", quantity, item_id=item_id, reason=reason, c=c)
+    player_cache.invalidate(user_id, profile=False)
+
+def get_inventory(user_id, page=0, page_size=INVENTORY_PAGE_SIZE):
+    """Get one page of a player's (item_id, name, rarity, quantity) rows, sorted by name.
+
+    Returns (items, page_count)."""
+    inventory = _cached_snapshot(("inventory", user_id), user_id, _load_inventory)
+    
+    page_count = max(1, -(-len(inventory) // page_size))
+    start = page * page_size
+    return list(inventory[start:start + page_size]), page_count
+
+def _load_inventory(c, user_id):
+    c.execute("SELECT item_id, quantity FROM inventory WHERE user_id = ?", (user_id,))
+    quantities = dict(c.fetchall())
+    c.execute('''SELECT item_id, SUM(amount) FROM ledger
+              WHERE user_id = ? AND item_id IS NOT NULL AND event_id > ?
+              GROUP BY item_id''', (user_id, _checkpoint_id(c)))
+    for item_id, amount in c.fetchall():
+        quantities[item_id] = quantities.get(item_id, 0) + amount
+    
+    c.execute("SELECT item_id, name, rarity FROM items")
+    items = {item_id: (name, rarity) for item_id, name, rarity in c.fetchall()}
+    inventory = [(item_id, items[item_id][0], items[item_id][1], quantity)
+                 for item_id, quantity in quantities.items() if quantity > 0 and item_id in items]
+    return tuple(sorted(inventory, key=lambda item: item[1]))
+
+def consume_item(user_id, item_name, quantity=1, reason=None):
+    """Remove items by name from a player's inventory; returns False if they have too few"""
+    with Database(immediate=True) as c:
+        return _consume_item(c, user_id, item_name, quantity, reason)
+
+def use_stamina_potion(user_id):
+    """Consume a Stamina Potion and restore 1 stamina in one transaction.
+
+    Returns the new stamina, or None if the player has no potion."""
+    with Database(immediate=True) as c:
+        if not _consume_item(c, user_id, "Stamina Potion", reason="stamina_potion"):
+            return None
+        c.execute("UPDATE players SET stamina = MIN(stamina + 1, max_stamina) WHERE user_id = ?",
+                  (user_id,))
+        c.execute("SELECT stamina FROM players WHERE user_id = ?", (user_id,))
+        stamina = c.fetchone()[0]
+    player_cache.invalidate(user_id)
+    return stamina
+
+def _consume_item(c, user_id, item_name, quantity=1, reason=None):
+    c.execute("SELECT item_id FROM items WHERE name = ?", (item_name,))
+    item = c.fetchone()
+    if not item or _item_quantity(c, user_id, item[0]) < quantity:
+        return False
+    ledger.record(user_id, "item_consume", -quantity, item_id=item[0], reason=reason, c=c)
+    player_cache.invalidate(user_id, profile=False)
+    return True
+
+def _item_quantity(c, user_id, item_id):
+    c.execute("SELECT quantity FROM inventory WHERE user_id = ? AND item_id = ?", (user_id, item_id))
+    row = c.fetchone()
+    c.execute('''SELECT COALESCE(SUM(amount), 0) FROM ledger
+              WHERE user_id = ? AND item_id = ? AND event_id > ?''',
+              (user_id, item_id, _checkpoint_id(c)))
+    return (row[0] if row else 0) + c.fetchone()[0]
 
 # Dungeon operations
 def start_dungeon(user_id, stamina_used, tier):
@@ -202,10 +608,16 @@ def start_dungeon(user_id, stamina_used, tier):
         # Deduct stamina
         c.execute("UPDATE players SET stamina = stamina - ?, current_dungeon_end = ?, current_dungeon_stamina = ? WHERE user_id = ?", 
                  (stamina_used, end_time, stamina_used, user_id))
+    player_cache.invalidate(user_id, inventory=False)
 
-def complete_dungeons(bot):
+def complete_dungeons():
+    """Resolve finished dungeons and grant their rewards.
+
+    Returns a list of (user_id, success, rewards) for the caller to notify,
+    where rewards["items"] holds item names."""
     current_time = datetime.now()
-    with Database() as c:
+    notifications = []
+    with Database(immediate=True) as c:
         c.execute('''SELECT d.dungeon_id, d.user_id, d.stamina_used, d.tier, d.end_time, 
                   p.stamina, p.max_stamina 
                   FROM dungeons d
@@ -231,18 +643,18 @@ def complete_dungeons(bot):
                 # Add random items
                 item_count = max(1, tier // 2)
                 for _ in range(item_count):
-                    item_id = get_random_item()
+                    item_id = _random_item_id(c)
                     if item_id:
                         rewards["items"].append(item_id)
-                        add_item_to_inventory(user_id, item_id)
+                        add_item_to_inventory(user_id, item_id, reason=f"dungeon:{dungeon_id}", c=c)
             else:
                 # Partial rewards
-                rewards["xp"] = tier * 25 * stamina_used * 0.5
+                rewards["xp"] = int(tier * 25 * stamina_used * 0.5)
                 rewards["coins"] = tier * 10 * stamina_used
             
             # Update player rewards
-            add_xp(user_id, rewards["xp"])
-            add_coins(user_id, rewards["coins"])
+            _apply_xp(c, user_id, rewards["xp"], reason=f"dungeon:{dungeon_id}")
+            add_coins(user_id, rewards["coins"], reason=f"dungeon:{dungeon_id}", c=c)
             
             # Update dungeon status
             c.execute("UPDATE dungeons SET status = ?, rewards = ? WHERE dungeon_id = ?", 
@@ -254,40 +666,172 @@ def complete_dungeons(bot):
             
             # Return stamina if failed
             if not success:
-                c.execute("UPDATE players SET stamina = LEAST(stamina + ?, ?) WHERE user_id = ?", 
+                c.execute("UPDATE players SET stamina = MIN(stamina + ?, ?) WHERE user_id = ?", 
                          (stamina_used // 2, max_stamina, user_id))
+            player_cache.invalidate(user_id, inventory=False)
             
-            # Notify player
-            try:
-                user = bot.get_user(user_id)
-                if user:
-                    embed = discord.Embed(
-                        title=f"🏰 Dungeon {'Successful!' if success else 'Failed'}",
-                        color=0x2ecc71 if success else 0xe74c3c
-                    )
-                    embed.set_thumbnail(url="https://i.imgur.com/7z9sKXb.png")
-                    embed.add_field(name="XP Earned", value=rewards["xp"], inline=True)
-                    embed.add_field(name="Coins Earned", value=f"{CURRENCY_ICON}{rewards['coins']}", inline=True)
-                    
-                    if rewards["items"]:
-                        items_list = "\n".join([get_item(item)['name'] for item in rewards["items"]])
-                        embed.add_field(name="Items Found", value=items_list, inline=False)
-                    
-                    await user.send(embed=embed)
-            except:
-                pass
+            # Queue notification
+            item_names = []
+            for item_id in rewards["items"]:
+                c.execute("SELECT name FROM items WHERE item_id = ?", (item_id,))
+                item_names.append(c.fetchone()[0])
+            notifications.append((user_id, success, dict(rewards, items=item_names)))
+    
+    return notifications
+
+# Ledger operations
+def _checkpoint_id(c):
+    c.execute("SELECT last_event_id FROM ledger_checkpoint WHERE id = 1")
+    row = c.fetchone()
+    return row[0] if row else 0
+
+def checkpoint_balances():
+    """Fold ledger events since the last checkpoint into players and inventory totals.
+
+    Effective balances are unchanged by this, so cached snapshots stay valid."""
+    with Database(immediate=True) as c:
+        return _fold_ledger(c)
+
+def _fold_ledger(c):
+    last_event_id = _checkpoint_id(c)
+    c.execute("SELECT COALESCE(MAX(event_id), 0) FROM ledger")
+    upto = c.fetchone()[0]
+    if upto <= last_event_id:
+        return 0
+    
+    c.execute('''SELECT user_id, kind, item_id, SUM(amount), COUNT(*) FROM ledger
+              WHERE event_id > ? AND event_id <= ?
+              GROUP BY user_id, kind, item_id''', (last_event_id, upto))
+    totals = c.fetchall()
+    
+    xp = [(amount, user_id) for user_id, kind, _, amount, _ in totals if kind == "xp"]
+    coins = [(amount, user_id) for user_id, kind, _, amount, _ in totals if kind == "coins"]
+    items = [(user_id, item_id, amount) for user_id, kind, item_id, amount, _ in totals
+             if kind in ("item_grant", "item_consume")]
+    
+    c.executemany("UPDATE players SET xp = xp + ? WHERE user_id = ?", xp)
+    c.executemany("UPDATE players SET coins = coins + ? WHERE user_id = ?", coins)
+    c.executemany('''INSERT OR IGNORE INTO inventory (user_id, item_id, quantity)
+                  VALUES (?, ?, 0)''', [(user_id, item_id) for user_id, item_id, _ in items])
+    c.executemany('''UPDATE inventory SET quantity = quantity + ?
+                  WHERE user_id = ? AND item_id = ?''',
+                  [(amount, user_id, item_id) for user_id, item_id, amount in items])
+    
+    c.execute("UPDATE ledger_checkpoint SET last_event_id = ? WHERE id = 1", (upto,))
+    return sum(total[4] for total in totals)
+
+def replay_ledger():
+    """Rebuild all players and inventory totals from the full ledger"""
+    with Database(immediate=True) as c:
+        c.execute("SELECT COALESCE(MAX(event_id), 0) FROM ledger")
+        upto = c.fetchone()[0]
+        c.execute('''UPDATE players SET
+                  xp = (SELECT COALESCE(SUM(amount), 0) FROM ledger
+                        WHERE ledger.user_id = players.user_id AND kind = 'xp' AND event_id <= ?),
+                  coins = (SELECT COALESCE(SUM(amount), 0) FROM ledger
+                           WHERE ledger.user_id = players.user_id AND kind = 'coins' AND event_id <= ?)''',
+                  (upto, upto))
+        c.execute("DELETE FROM inventory")
+        c.execute('''INSERT INTO inventory (user_id, item_id, quantity)
+                  SELECT user_id, item_id, SUM(amount) FROM ledger
+                  WHERE kind IN ('item_grant', 'item_consume') AND event_id <= ?
+                  GROUP BY user_id, item_id''', (upto,))
+        c.execute("UPDATE ledger_checkpoint SET last_event_id = ? WHERE id = 1", (upto,))
+    player_cache.clear()
+
+def get_ledger_events(user_id, limit=25):
+    """Get a player's most recent economy events for auditing"""
+    with Database() as c:
+        c.execute('''SELECT event_id, kind, item_id, amount, reason, created_at FROM ledger
+                  WHERE user_id = ? ORDER BY event_id DESC LIMIT ?''', (user_id, limit))
+        return c.fetchall()
+
+# Worker coordination
+def acquire_lease(name, holder, ttl_seconds):
+    """Take or renew a named lease; returns True if holder owns it until ttl_seconds from now"""
+    now = time.time()
+    with Database(immediate=True) as c:
+        c.execute("INSERT OR IGNORE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)",
+                  (name, holder, now + ttl_seconds))
+        c.execute('''UPDATE leases SET holder = ?, expires_at = ?
+                  WHERE name = ? AND (holder = ? OR expires_at <= ?)''',
+                  (holder, now + ttl_seconds, name, holder, now))
+        return c.rowcount == 1
 
 # Utility functions
+def build_level_thresholds(base_xp, xp_multiplier, max_level=MAX_LEVEL):
+    """Build the XP needed to reach each level (index 0 is level 1)"""
+    return [base_xp * xp_multiplier ** i for i in range(max_level)]
+
+def _config_level_curve():
+    # A fresh parser, so keys removed from config.ini fall back to defaults
+    curve_config = configparser.ConfigParser()
+    curve_config.read('config.ini')
+    return (
+        curve_config.getint('GAME', 'base_xp', fallback=100),
+        curve_config.getfloat('GAME', 'xp_multiplier', fallback=1.5),
+        curve_config.getint('GAME', 'max_level', fallback=100)
+    )
+
+def reload_level_curve():
+    """Re-read the XP curve from config.ini and publish it to every worker"""
+    with Database(immediate=True) as c:
+        _publish_level_curve(c, _config_level_curve())
+    return LEVEL_THRESHOLDS
+
+def _publish_level_curve(c, curve):
+    c.execute("SELECT version, base_xp, xp_multiplier, max_level FROM level_curve WHERE id = 1")
+    row = c.fetchone()
+    if row is None:
+        c.execute('''INSERT INTO level_curve (id, version, base_xp, xp_multiplier, max_level)
+                  VALUES (1, 1, ?, ?, ?)''', curve)
+    elif tuple(row[1:]) != tuple(curve):
+        c.execute('''UPDATE level_curve SET version = version + 1, base_xp = ?, xp_multiplier = ?, max_level = ?
+                  WHERE id = 1''', curve)
+    _refresh_level_curve(c)
+
+def _refresh_level_curve(c):
+    """Rebuild the threshold table if another worker published a new curve"""
+    global LEVEL_THRESHOLDS, LEVEL_CURVE_VERSION
+    c.execute("SELECT version, base_xp, xp_multiplier, max_level FROM level_curve WHERE id = 1")
+    row = c.fetchone()
+    if row and row[0] != LEVEL_CURVE_VERSION:
+        LEVEL_THRESHOLDS = build_level_thresholds(*row[1:])
+        LEVEL_CURVE_VERSION = row[0]
+
+# Built from config until the shared curve is read from the database
+LEVEL_THRESHOLDS = build_level_thresholds(*_config_level_curve())
+LEVEL_CURVE_VERSION = None
+
 def calculate_level(xp):
-    BASE_XP = 100
-    XP_MULTIPLIER = 1.5
-    return max(1, int(math.log(max(1, xp / BASE_XP), XP_MULTIPLIER) + 1))
+    return max(1, bisect_right(LEVEL_THRESHOLDS, xp))
 
 def get_level_tier(level):
-    if level < 5: return "beginner"
-    elif level < 10: return "apprentice"
-    elif level < 20: return "journeyman"
-    elif level < 30: return "adept"
-    elif level < 40: return "expert"
-    elif level < 50: return "master"
-    else: return "grandmaster"
\ No newline at end of file
+    return TIER_NAMES[bisect_right(TIER_LEVELS, level)]
+
+def recalculate_levels():
+    """Re-level every player against the current XP curve in one pass.
+
+    Returns (players_updated, tier_changes)."""
+    with Database(immediate=True) as c:
+        # Fold in the same transaction so players.xp includes every committed event
+        _fold_ledger(c)
+        _refresh_level_curve(c)
+        c.execute("SELECT user_id, xp, level, tier FROM players")
+        players = c.fetchall()
+
+        updates = []
+        tier_changes = 0
+        for user_id, xp, level, tier in players:
+            new_level = calculate_level(xp)
+            new_tier = get_level_tier(new_level)
+            if new_level == level and new_tier == tier:
+                continue
+            if new_tier != tier:
+                tier_changes += 1
+            updates.append((new_level, new_tier, user_id))
+
+        c.executemany("UPDATE players SET level = ?, tier = ? WHERE user_id = ?", updates)
+    for _, _, user_id in updates:
+        player_cache.invalidate(user_id, inventory=False)
+    return len(updates), tier_changes
@@ -3,8 +3,10 @@ import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 import database
+import supervisor
 import random
 import os
+import asyncio
 import configparser
 from datetime import datetime
 from utils import views, helpers
@@ -33,12 +35,29 @@ MESSAGE_XP_MIN = int(config['GAME']['message_xp_min'])
 MESSAGE_XP_MAX = int(config['GAME']['message_xp_max'])
 MAX_STAMINA = int(config['GAME']['max_stamina'])
 CURRENCY_ICON = config['GAME']['currency_icon']
+LEDGER_CHECKPOINT_MINUTES = int(config['GAME']['ledger_checkpoint_minutes'])
+WORKERS = int(config['GAME']['workers'])
+SHARD_COUNT = int(config['GAME']['shard_count'])
+JOB_LEASE_SECONDS = int(config['GAME']['job_lease_seconds'])
+
+# Set by the supervisor when running as one of several sharded workers
+WORKER_ID = os.getenv('WORKER_ID')
+SHARD_IDS = os.getenv('SHARD_IDS')
+WORKER_NAME = f"worker-{WORKER_ID}:{os.getpid()}" if WORKER_ID else f"main:{os.getpid()}"
 
 # Initialize bot
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+if SHARD_IDS:
+    bot = commands.AutoShardedBot(
+        command_prefix="!",
+        intents=intents,
+        shard_ids=[int(shard) for shard in SHARD_IDS.split(',')],
+        shard_count=int(os.getenv('SHARD_COUNT'))
+    )
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents)
 
 # Keep-alive server
 app = Flask('')
@@ -48,33 +67,71 @@ def home():
 def run():
     app.run(host='0.0.0.0', port=8080)
 def keep_alive():
-    t = Thread(target=run)
+    t = Thread(target=run, daemon=True)
     t.start()
-keep_alive()
 
-# Background tasks
+# Background tasks run on exactly one worker, whichever holds that job's lease
+async def run_leader_job(name, job, lease_seconds=JOB_LEASE_SECONDS):
+    """Run a blocking job off the event loop if this worker holds its lease.
+
+    Errors are logged rather than raised, since an exception would stop the
+    tasks.loop for good while the lease kept other workers from taking over."""
+    try:
+        if await asyncio.to_thread(database.acquire_lease, name, WORKER_NAME, lease_seconds):
+            return await asyncio.to_thread(job)
+    except Exception as e:
+        print(f"{name} error: {e}")
+    return None
+
 @tasks.loop(minutes=1)
 async def stamina_regeneration():
-    database.regenerate_stamina()
+    await run_leader_job("stamina_regeneration", database.regenerate_stamina)
 
 @tasks.loop(minutes=1)
 async def dungeon_completion():
-    database.complete_dungeons(bot)
+    notifications = await run_leader_job("dungeon_completion", database.complete_dungeons)
+    
+    for user_id, success, rewards in notifications or []:
+        # Notify player
+        try:
+            user = bot.get_user(user_id) or await bot.fetch_user(user_id)
+            embed = discord.Embed(
+                title=f"🏰 Dungeon {'Successful!' if success else 'Failed'}",
+                color=0x2ecc71 if success else 0xe74c3c
+            )
+            embed.set_thumbnail(url=helpers.get_asset("dungeon"))
+            embed.add_field(name="XP Earned", value=rewards["xp"], inline=True)
+            embed.add_field(name="Coins Earned", value=f"{CURRENCY_ICON}{rewards['coins']}", inline=True)
+            
+            if rewards["items"]:
+                embed.add_field(name="Items Found", value="\n".join(rewards["items"]), inline=False)
+            
+            await user.send(embed=embed)
+        except Exception as e:
+            print(f"Dungeon notification error: {e}")
+
+@tasks.loop(minutes=LEDGER_CHECKPOINT_MINUTES)
+async def ledger_checkpoint():
+    # The lease outlives one interval so leadership does not change every run
+    await run_leader_job("ledger_checkpoint", database.checkpoint_balances,
+                         lease_seconds=max(JOB_LEASE_SECONDS, LEDGER_CHECKPOINT_MINUTES * 120))
 
 @bot.event
 async def on_ready():
     print(f'Logged in as {bot.user.name}')
     
-    # Sync commands
-    try:
-        synced = await bot.tree.sync()
-        print(f"Synced {len(synced)} commands")
-    except Exception as e:
-        print(f"Command syncing error: {e}")
+    # Sync commands (global, so only once per deployment)
+    if WORKER_ID in (None, '0'):
+        try:
+            synced = await bot.tree.sync()
+            print(f"Synced {len(synced)} commands")
+        except Exception as e:
+            print(f"Command syncing error: {e}")
     
     # Start background tasks
     stamina_regeneration.start()
     dungeon_completion.start()
+    ledger_checkpoint.start()
     
     # Create interface messages
     for guild in bot.guilds:
@@ -126,6 +183,12 @@ async def dashboard(interaction: discord.Interaction):
     view = views.DashboardView()
     await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
+@bot.tree.command(name="inventory", description="View your inventory")
+async def inventory(interaction: discord.Interaction):
+    """Show the player's inventory, one page at a time"""
+    view = views.InventoryView(interaction.user.id)
+    await interaction.response.send_message(embed=view.build_embed(), view=view, ephemeral=True)
+
 @bot.tree.command(name="register", description="Register as an adventurer")
 async def register(interaction: discord.Interaction):
     """Register a new player"""
@@ -191,7 +254,70 @@ async def admin_add_item(
     embed.set_thumbnail(url=image_url)
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
+def reload_and_recalculate_levels():
+    database.reload_level_curve()
+    return database.recalculate_levels()
+
+@bot.tree.command(name="recalculate_levels", description="Re-level all players after changing the XP curve")
+@app_commands.checks.has_role(ADMIN_ROLE)
+async def admin_recalculate_levels(interaction: discord.Interaction):
+    """Reload the XP curve from config and re-level every player"""
+    # A full re-level can outlast the 3s interaction deadline
+    await interaction.response.defer(ephemeral=True)
+    updated, tier_changes = await asyncio.to_thread(reload_and_recalculate_levels)
+    embed = discord.Embed(
+        title="✅ Levels Recalculated",
+        description="All players have been re-leveled against the current XP curve",
+        color=0x00ff00
+    )
+    embed.add_field(name="Players Updated", value=updated)
+    embed.add_field(name="Tier Changes", value=tier_changes)
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="ledger", description="Show a player's recent economy events")
+@app_commands.checks.has_role(ADMIN_ROLE)
+async def admin_ledger(interaction: discord.Interaction, member: discord.Member):
+    """Audit a player's XP, coin and item history"""
+    events = database.get_ledger_events(member.id, limit=10)
+    embed = discord.Embed(
+        title=f"📒 Ledger: {member.name}",
+        description=f"Most recent {len(events)} economy events",
+        color=0x3498db
+    )
+    lines = []
+    for event_id, kind, item_id, amount, reason, created_at in events:
+        item = f" (item {item_id})" if item_id else ""
+        lines.append(f"`#{event_id}` {kind}{item}: {amount:+} — {reason or 'unspecified'}")
+    embed.add_field(name="Events", value="\n".join(lines) or "No events recorded", inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="cache_stats", description="Show player cache statistics")
+@app_commands.checks.has_role(ADMIN_ROLE)
+async def admin_cache_stats(interaction: discord.Interaction):
+    """Show player profile and inventory cache statistics"""
+    stats = database.player_cache.stats()
+    embed = discord.Embed(
+        title="📊 Player Cache",
+        description=f"Worker {WORKER_ID or 'main'}",
+        color=0x3498db
+    )
+    embed.add_field(name="Entries", value=f"{stats['size']}/{stats['max_size']}")
+    embed.add_field(name="Hit Rate", value=f"{stats['hit_rate']:.1%}")
+    embed.add_field(name="Hits / Misses", value=f"{stats['hits']} / {stats['misses']}")
+    embed.add_field(name="Evictions", value=stats['evictions'])
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 # Run the bot
 if __name__ == "__main__":
-    database.initialize_database()
-    bot.run(BOT_TOKEN)
\ No newline at end of file
+    if not WORKER_ID:
+        database.initialize_database()
+        keep_alive()
+    
+    if WORKERS > 1 and not WORKER_ID:
+        supervisor.Supervisor(WORKERS, max(SHARD_COUNT, WORKERS)).run()
+    else:
+        database.ledger.start()
+        try:
+            bot.run(BOT_TOKEN)
+        finally:
+            database.checkpoint_balances()
\ No newline at end of file
@@ -0,0 +1,70 @@
+# supervisor.py - Multi-process shard supervisor
+import os
+import sys
+import time
+import signal
+import subprocess
+
+# Minimum seconds between restarts of the same worker
+RESTART_DELAY = 10
+
+def shard_assignments(shard_count, workers):
+    """Split gateway shard ids round-robin across worker processes"""
+    return [[shard for shard in range(shard_count) if shard % workers == worker] for worker in range(workers)]
+
+class Supervisor:
+    """Runs one bot process per worker, each owning a subset of gateway shards.
+
+    Workers are started as `main.py` with WORKER_ID, SHARD_IDS and SHARD_COUNT
+    set in their environment, and are restarted if they exit."""
+
+    def __init__(self, workers, shard_count, script='main.py'):
+        self.shard_count = shard_count
+        self.assignments = shard_assignments(shard_count, workers)
+        self.script = script
+        self.processes = {}
+        self.started_at = {}
+        self.running = False
+
+    def spawn(self, worker_id):
+        env = dict(os.environ,
+                   WORKER_ID=str(worker_id),
+                   SHARD_IDS=",".join(str(shard) for shard in self.assignments[worker_id]),
+                   SHARD_COUNT=str(self.shard_count))
+        self.processes[worker_id] = subprocess.Popen([sys.executable, self.script], env=env)
+        self.started_at[worker_id] = time.time()
+        print(f"Started worker {worker_id} (pid {self.processes[worker_id].pid}) "
+              f"with shards {self.assignments[worker_id]}")
+
+    def run(self):
+        self.running = True
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        for worker_id in range(len(self.assignments)):
+            self.spawn(worker_id)
+
+        try:
+            while self.running:
+                time.sleep(1)
+                for worker_id, process in list(self.processes.items()):
+                    if process.poll() is None or not self.running:
+                        continue
+                    if time.time() - self.started_at[worker_id] < RESTART_DELAY:
+                        continue
+                    print(f"Worker {worker_id} exited with code {process.returncode}, restarting")
+                    self.spawn(worker_id)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.running = False
+        # SIGINT lets workers shut down cleanly and checkpoint the ledger
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGINT)
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
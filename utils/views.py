@@ -2,6 +2,7 @@
 import discord
 from discord.ui import Button, View, Select
 import database
+from utils import helpers
 from datetime import datetime, timedelta
 
 class DashboardView(View):
@@ -53,7 +54,7 @@ class DungeonView(View):
         self.add_item(potion_button)
     
     async def start_dungeon(self, interaction, stamina):
-        player = database.get_player(self.user_id)
+        player = database.get_player(self.user_id, bypass_cache=True)
         if not player:
             return
         
@@ -84,29 +85,11 @@ class DungeonView(View):
         if not player:
             return
         
-        # Check stamina potion in inventory
-        with database.Database() as c:
-            c.execute('''SELECT inventory.quantity 
-                      FROM inventory 
-                      JOIN items ON inventory.item_id = items.item_id 
-                      WHERE user_id = ? AND items.name = 'Stamina Potion' ''', 
-                      (self.user_id,))
-            potion = c.fetchone()
-            
-            if not potion or potion[0] < 1:
-                await interaction.response.send_message("❌ You don't have any Stamina Potions!", ephemeral=True)
-                return
-            
-            # Update stamina
-            new_stamina = min(player['stamina'] + 1, player['max_stamina'])
-            c.execute("UPDATE players SET stamina = ? WHERE user_id = ?", 
-                     (new_stamina, self.user_id))
-            
-            # Remove potion
-            c.execute('''UPDATE inventory SET quantity = quantity - 1 
-                      WHERE user_id = ? AND item_id = (
-                          SELECT item_id FROM items WHERE name = 'Stamina Potion'
-                      )''', (self.user_id,))
+        # Remove potion and restore stamina
+        new_stamina = database.use_stamina_potion(self.user_id)
+        if new_stamina is None:
+            await interaction.response.send_message("❌ You don't have any Stamina Potions!", ephemeral=True)
+            return
         
         # Send confirmation
         embed = discord.Embed(
@@ -118,6 +101,37 @@ class DungeonView(View):
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+class InventoryView(View):
+    def __init__(self, user_id, page=0):
+        super().__init__(timeout=120)
+        self.user_id = user_id
+        self.page = page
+        self.items, self.page_count = database.get_inventory(user_id, page)
+        
+        # Page buttons
+        previous_button = Button(label="◀ Previous", style=discord.ButtonStyle.secondary, disabled=page <= 0)
+        previous_button.callback = lambda i: self.show_page(i, self.page - 1)
+        self.add_item(previous_button)
+        
+        next_button = Button(label="Next ▶", style=discord.ButtonStyle.secondary, disabled=page >= self.page_count - 1)
+        next_button.callback = lambda i: self.show_page(i, self.page + 1)
+        self.add_item(next_button)
+    
+    def build_embed(self):
+        embed = discord.Embed(
+            title="🎒 Inventory",
+            description=f"Page {self.page + 1}/{self.page_count}",
+            color=0x3498db
+        )
+        lines = [f"{helpers.get_rarity_emoji(rarity)} **{name}** x{quantity}"
+                 for _, name, rarity, quantity in self.items]
+        embed.add_field(name="Items", value="\n".join(lines) or "Your inventory is empty", inline=False)
+        return embed
+    
+    async def show_page(self, interaction, page):
+        view = InventoryView(self.user_id, page)
+        await interaction.response.edit_message(embed=view.build_embed(), view=view)
+
 class AdminDashboardView(View):
     def __init__(self):
         super().__init__(timeout=None)